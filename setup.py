@@ -7,7 +7,6 @@ setup(
     packages=find_packages("src"),
     install_requires=[
         "openai==0.28.0",
-        "aiolimiter==1.1.0",
     ],
     python_requires=">=3.9",
     author="JMZAM",
@@ -1 +1,3 @@
 from .evaluator import ReportEvaluator 
+from .scheduler import EvaluationScheduler, JobStats
+from .sequential import SequentialEvaluator
@@ -0,0 +1,103 @@
+import logging
+import threading
+import time
+from typing import Callable, List
+
+
+class RunControl:
+    """Stop state of a single evaluation run.
+
+    A run is stopped when its time budget runs out, when the process receives
+    SIGINT or SIGTERM, or when `ReportEvaluator.cancel` is called. After a stop,
+    no new requests are sent and in-flight requests are given a grace period to
+    finish, unless the stop is forced.
+
+    A run can be part of a larger one, e.g. a batch of a sequential comparison:
+    it is then stopped with its parent, and its time budget is capped by what is
+    left of the parent's.
+
+    Args:
+    - time_budget: float | None, the wall-clock budget of the run in seconds, or None for no limit
+    - parent: RunControl | None, the enclosing run, if any
+    """
+
+    def __init__(
+        self, time_budget: float | None = None, parent: "RunControl | None" = None
+    ) -> None:
+        self.time_budget = time_budget
+        self.parent = parent
+        self.stopped = threading.Event()
+        self.forced = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.RLock()
+        self._timer: threading.Timer | None = None
+        self._deadline: float | None = None
+
+    def start(self) -> None:
+        """Start counting down the time budget."""
+        if self.parent is not None:
+            parent_remaining = self.parent.remaining()
+            if parent_remaining is not None:
+                self.time_budget = (
+                    parent_remaining
+                    if self.time_budget is None
+                    else min(self.time_budget, parent_remaining)
+                )
+            self.parent.add_callback(self._on_parent_stop)
+
+        if self.time_budget is None:
+            return
+        self._deadline = time.monotonic() + self.time_budget
+        self._timer = threading.Timer(self.time_budget, self._on_timeout)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self.parent is not None:
+            self.parent.remove_callback(self._on_parent_stop)
+
+    def remaining(self) -> float | None:
+        """Returns the seconds left in the time budget, or None if there is no budget."""
+        if self._deadline is None:
+            return None
+        return max(0.0, self._deadline - time.monotonic())
+
+    def stop(self, force: bool = False) -> None:
+        """Stop the run; with `force`, in-flight requests are not waited for.
+
+        Can be called from any thread, or from a signal handler.
+        """
+        self.stopped.set()
+        if force:
+            self.forced.set()
+        with self._lock:
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback: Callable[[], None]) -> None:
+        """Register a function called on every stop, e.g. to wake up a waiting event loop."""
+        with self._lock:
+            self._callbacks.append(callback)
+        if self.stopped.is_set():
+            callback()
+
+    def remove_callback(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def _on_parent_stop(self) -> None:
+        self.stop(force=self.parent.forced.is_set())
+
+    def _on_timeout(self) -> None:
+        if self.stopped.is_set():
+            # Stopped already, e.g. by the parent run whose budget ran out.
+            return
+        logging.warning(
+            f"Time budget of {self.time_budget} seconds exceeded. Stopping the evaluation."
+        )
+        self.stop()
@@ -164,3 +164,18 @@ def extract_rating_dicts(
         return None, None
 
     return parse_rating_text(rating_text)
+
+
+def count_errors(error_dict: Dict[str, int] | None) -> int | None:
+    """Counts the total number of errors in a parsed rating.
+
+    Args:
+    - error_dict: Dict[str, int] | None, the errors by type, e.g. the clinically significant errors
+
+    Returns:
+    - n_errors: int | None, the total number of errors, or None if the rating is invalid
+    """
+    if error_dict is None:
+        return None
+
+    return sum(error_dict.values())
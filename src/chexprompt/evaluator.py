@@ -1,15 +1,27 @@
+import contextlib
+import contextvars
+import copy
+import itertools
 import json
 import os
 import logging
-from typing import Any, Dict, List, Tuple
+import signal
+import threading
+import time
+from concurrent.futures import Future
+from queue import Empty, SimpleQueue
+from typing import Any, Dict, Iterator, List, Tuple
 
 import asyncio
-import aiolimiter
 import openai
 import openai.error
 from aiohttp import ClientSession
-from tqdm.asyncio import tqdm_asyncio
+from tqdm import tqdm
+from chexprompt.cancellation import RunControl
 from chexprompt.eval_utils import format_full_prompt, extract_rating_dicts
+from chexprompt.hedging import HedgeBudget, LatencyTracker
+from chexprompt.limiter import ThreadSafeRateLimiter
+from chexprompt.scheduler import EvaluationScheduler
 
 SYSTEM_INSTRUCTIONS = "Instructions: You are an expert radiologist. Judge the diagnostic accuracy of generated radiology report findings based on a reference findings section. For each error type, count how many errors exist in the candidate report. Examples are provided for you. For clinically significant and clinically insignificant errors of 6 error types, count how many of each error type there are. Refer to the reference and candidate findings as needed to keep maximum accuracy in counting each error type. Finally, provide the error counts in the list format exactly as it is given to you."
 
@@ -72,6 +84,29 @@ Number of clinically insignificant errors by type: ((A, 1), (B, 0), (C, 0), (D,
 ##"""
 
 
+FILTERED_RESPONSE = {
+    "choices": [{"message": {"content": "Invalid Request: Prompt was filtered"}}]
+}
+EMPTY_RESPONSE = {"choices": [{"message": {"content": ""}}]}
+RETRIED_ERRORS = (
+    openai.error.RateLimitError,
+    asyncio.exceptions.TimeoutError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+    openai.error.APIError,
+)
+
+DEFAULT_NUM_WORKERS = 8
+
+UNFINISHED = "unfinished"
+
+_job_ids = itertools.count(1)
+# The run that evaluations started in the current context are part of.
+_current_run: contextvars.ContextVar[RunControl | None] = contextvars.ContextVar(
+    "current_run", default=None
+)
+
+
 class ReportEvaluator:
     def __init__(
         self,
@@ -85,7 +120,19 @@ class ReportEvaluator:
         stop: List[str] | None = None,
         max_retries: int = 1,
         use_async: bool = False,
+        num_workers: int | None = None,
+        request_timeout: float | None = None,
+        hedge_percentile: float | None = None,
+        hedge_engine: str | None = None,
+        hedge_budget: float = 0.1,
+        time_budget: float | None = None,
+        grace_period: float = 30.0,
     ) -> None:
+        if hedge_percentile is not None and not 0 < hedge_percentile < 1:
+            raise ValueError("Hedge percentile must be between 0 and 1.")
+        if hedge_budget < 0:
+            raise ValueError("Hedge budget must not be negative.")
+
         self.engine = engine
         self.temperature = temperature
         self.max_tokens = max_tokens
@@ -96,6 +143,22 @@ class ReportEvaluator:
         self.stop = stop
         self.max_retries = max_retries
         self.use_async = use_async
+        self.num_workers = num_workers
+        self.request_timeout = request_timeout
+        self.hedge_percentile = hedge_percentile
+        self.hedge_engine = hedge_engine
+        self.latency_tracker = LatencyTracker()
+        self.hedge_budget = HedgeBudget(hedge_budget)
+        self.time_budget = time_budget
+        self.grace_period = grace_period
+        self._active_runs = set()
+        # One quota for all requests of this evaluator, whether they are sent
+        # from threads or from an event loop, and across `evaluate` calls.
+        self.rate_limiter = ThreadSafeRateLimiter(requests_per_minute)
+        self._scheduler: EvaluationScheduler | None = None
+        # Number of chat completion requests sent, including retries and hedges.
+        self.api_calls = 0
+        self._api_calls_lock = threading.Lock()
 
     def format_for_evaluation(self, reference: str, candidate: str) -> Tuple[str, str]:
         """Format the reference and candidate for evaluation.
@@ -130,99 +193,380 @@ class ReportEvaluator:
         - candidates: List[str], the candidate, or generated reports
 
         Returns:
-        - results: List[Dict[str, Dict[str, int]]], the evaluation results
+        - results: List[Dict[str, Dict[str, int]]], the evaluation results; if the run
+            is stopped by its time budget, a signal or `cancel`, the items that were not
+            rated are marked with {"status": "unfinished"}
         """
 
-        if isinstance(references, str):
-            references = [references]
-        if isinstance(candidates, str):
-            candidates = [candidates]
+        use_threads = (
+            not self.use_async
+            and self.num_workers is not None
+            and self.num_workers > 1
+        )
+        if self.use_async and _is_event_loop_running():
+            logging.warning(
+                "An event loop is already running, evaluating in a thread pool instead. "
+                "Use `await evaluator.evaluate_async(...)` to use the async API."
+            )
+            use_threads = True
+
+        # Set while a serial request blocks the main thread, so that it can be aborted.
+        interruptible = threading.Event()
+        with self._stop_on_signals(interruptible):
+            if use_threads:
+                formatted_prompts = self._format_prompts(references, candidates)
+                results = self._evaluate_threaded(formatted_prompts)
+
+            elif not self.use_async:
+                formatted_prompts = self._format_prompts(references, candidates)
+                results = []
+                with self._run_control() as run_control:
+                    try:
+                        for formatted_prompt in formatted_prompts:
+                            if run_control.stopped.is_set():
+                                break
+                            # Requests past their deadline are retried with the
+                            # policy of the other paths, instead of failing the run.
+                            interruptible.set()
+                            try:
+                                result = self._evaluate_one(
+                                    formatted_prompt,
+                                    limiter=(
+                                        self.rate_limiter
+                                        if self.request_timeout is not None
+                                        else None
+                                    ),
+                                )
+                            finally:
+                                interruptible.clear()
+                            results.append(result)
+                    except KeyboardInterrupt:
+                        # Raised by a forced stop to abort the in-flight request.
+                        if not run_control.forced.is_set():
+                            raise
+                    results += [
+                        _unfinished_result()
+                        for _ in range(len(formatted_prompts) - len(results))
+                    ]
+
+            else:
+                results = asyncio.run(self.evaluate_async(references, candidates))
+
+        n_unfinished = sum(result.get("status") == UNFINISHED for result in results)
+        if n_unfinished > 0:
+            logging.warning(
+                f"Evaluation stopped early: {n_unfinished} of {len(results)} reports were not rated."
+            )
 
-        formatted_prompts = []
-        results = []
-        for reference, candidate in zip(references, candidates):
-            system_prompt, user_prompt = self.format_for_evaluation(
-                reference, candidate
+        return results
+
+    def cancel(self, force: bool = False) -> None:
+        """Stop the running evaluations of this evaluator.
+
+        No new requests are sent, and in-flight requests are given `grace_period`
+        seconds to finish, or none if `force` is set. The evaluations then return
+        the completed results, with unfinished items marked. Can be called from
+        another thread or from a signal handler.
+
+        Args:
+        - force: bool, do not wait for in-flight requests
+        """
+        for run_control in list(self._active_runs):
+            run_control.stop(force=force)
+
+    @contextlib.contextmanager
+    def _run_control(self) -> Iterator[RunControl]:
+        """Track a run so that it is stopped by `cancel` or when `time_budget` runs out.
+
+        Runs started within another run, e.g. the batches of a sequential
+        comparison, are part of it: they stop with it and share its time budget.
+        """
+        run_control = RunControl(
+            time_budget=self.time_budget, parent=_current_run.get()
+        )
+        self._active_runs.add(run_control)
+        token = _current_run.set(run_control)
+        run_control.start()
+        try:
+            yield run_control
+        finally:
+            run_control.close()
+            _current_run.reset(token)
+            self._active_runs.discard(run_control)
+
+    @contextlib.contextmanager
+    def _stop_on_signals(
+        self, interruptible: threading.Event | None = None
+    ) -> Iterator[None]:
+        """Turn SIGINT and SIGTERM into `cancel`; a second signal forces the stop.
+
+        Args:
+        - interruptible: threading.Event | None, while set, a forced stop also raises
+            KeyboardInterrupt, to abort a blocking request made from the main thread
+        """
+        if threading.current_thread() is not threading.main_thread():
+            yield
+            return
+
+        n_signals = 0
+
+        def _handler(signum, frame):
+            nonlocal n_signals
+            n_signals += 1
+            logging.warning(
+                f"Received {signal.Signals(signum).name}. Stopping the evaluation "
+                f"after in-flight requests finish, send it again to stop immediately."
             )
-            formatted_prompts.append(format_full_prompt(system_prompt, user_prompt))
+            self.cancel(force=n_signals > 1)
+            if n_signals > 1 and interruptible is not None and interruptible.is_set():
+                raise KeyboardInterrupt
+
+        previous_handlers = {
+            sig: signal.signal(sig, _handler) for sig in (signal.SIGINT, signal.SIGTERM)
+        }
+        try:
+            yield
+        finally:
+            for sig, handler in previous_handlers.items():
+                signal.signal(sig, handler)
 
-        if not self.use_async:
-            for formatted_prompt in formatted_prompts:
-                result = self._evaluate_one(formatted_prompt)
-                results.append(result)
+    def _evaluate_threaded(
+        self,
+        formatted_prompts: List[List[Dict[str, str]]],
+    ) -> List[Dict[str, Dict[str, int]]]:
+        """Evaluate the prompts in a thread pool sharing one rate limiter.
+
+        Args:
+        - formatted_prompts: List[List[Dict[str, str]]], the prompts for evaluation
 
-        else:
-            responses = asyncio.run(
-                self.generate_openai_batch_chat_completion(formatted_prompts)
+        Returns:
+        - results: List[Dict[str, Dict[str, int]]], the evaluation results, in the order of the prompts
+        """
+        limiter = self.rate_limiter
+        num_workers = (
+            self.num_workers
+            if self.num_workers is not None and self.num_workers > 1
+            else DEFAULT_NUM_WORKERS
+        )
+
+        def _evaluate_unless_stopped(formatted_prompt):
+            if run_control.stopped.is_set():
+                return _unfinished_result()
+            return self._evaluate_one(formatted_prompt, limiter=limiter)
+
+        def _work():
+            while True:
+                try:
+                    future, formatted_prompt = work_queue.get_nowait()
+                except Empty:
+                    return
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(_evaluate_unless_stopped(formatted_prompt))
+                except BaseException as e:
+                    future.set_exception(e)
+
+        with self._run_control() as run_control:
+            futures = [Future() for _ in formatted_prompts]
+            work_queue = SimpleQueue()
+            for future, formatted_prompt in zip(futures, formatted_prompts):
+                work_queue.put((future, formatted_prompt))
+
+            # Woken up when all futures are done or the run is stopped.
+            wake = threading.Event()
+            run_control.add_callback(wake.set)
+            progress_bar = tqdm(total=len(futures))
+            n_done = 0
+            n_done_lock = threading.Lock()
+
+            def _on_done(future):
+                nonlocal n_done
+                progress_bar.update(1)
+                with n_done_lock:
+                    n_done += 1
+                    if n_done == len(futures):
+                        wake.set()
+
+            for future in futures:
+                future.add_done_callback(_on_done)
+            if len(futures) == 0:
+                wake.set()
+
+            # Unlike those of a ThreadPoolExecutor, daemon workers are not joined at
+            # interpreter exit, so requests abandoned by a stop do not delay it.
+            for _ in range(min(num_workers, len(futures))):
+                threading.Thread(target=_work, daemon=True).start()
+
+            wake.wait()
+            if n_done < len(futures):
+                for future in futures:
+                    future.cancel()
+                if not run_control.forced.is_set():
+                    logging.warning(
+                        f"Waiting up to {self.grace_period} seconds for in-flight requests."
+                    )
+                    wake.clear()
+                    if n_done < len(futures):
+                        wake.wait(timeout=self.grace_period)
+            progress_bar.close()
+
+        results = []
+        for future in futures:
+            if future.done() and not future.cancelled():
+                results.append(future.result())
+            else:
+                results.append(_unfinished_result())
+
+        return results
+
+    async def evaluate_async(
+        self,
+        references: List[str] | str,
+        candidates: List[str] | str,
+        scheduler: EvaluationScheduler | None = None,
+        job_name: str | None = None,
+    ) -> List[Dict[str, Dict[str, int]]]:
+        """Evaluate the candidates against the references using the async API.
+
+        Several calls can run concurrently on the same event loop and share one
+        `EvaluationScheduler`, e.g. to rate several report generators at once.
+
+        Args:
+        - references: List[str], the reference, or ground truth reports
+        - candidates: List[str], the candidate, or generated reports
+        - scheduler: EvaluationScheduler | None, a scheduler shared with other jobs;
+            if None, the evaluator's own scheduler, limited to `requests_per_minute`, is used
+        - job_name: str | None, the scheduler job to submit requests to, defaults to a new job for this call
+
+        Returns:
+        - results: List[Dict[str, Dict[str, int]]], the evaluation results; if the run
+            is stopped by its time budget or `cancel`, the items that were not rated are
+            marked with {"status": "unfinished"}
+        """
+        formatted_prompts = self._format_prompts(references, candidates)
+        owns_job = job_name is None
+        if owns_job:
+            job_name = self._new_job_name()
+
+        with self._run_control() as run_control:
+            responses = await self.generate_openai_batch_chat_completion(
+                formatted_prompts,
+                scheduler=scheduler,
+                job_name=job_name,
+                run_control=run_control,
             )
-            completion_dicts = [
-                {
-                    "clinically_significant": significant,
-                    "clinically_insignificant": insignificant,
-                }
-                for significant, insignificant in [
-                    extract_rating_dicts(response) for response in responses
-                ]
-            ]
+            completion_dicts = []
+            for response in responses:
+                if response is None:
+                    completion_dicts.append(_unfinished_result())
+                    continue
+                significant, insignificant = extract_rating_dicts(response)
+                completion_dicts.append(
+                    {
+                        "clinically_significant": significant,
+                        "clinically_insignificant": insignificant,
+                    }
+                )
 
             num_retries = 0
-            n_to_retry = sum(
-                [
-                    (
-                        1
-                        if cd["clinically_significant"] is None
+            while num_retries < self.max_retries and not run_control.stopped.is_set():
+                to_retry = [
+                    i
+                    for i, cd in enumerate(completion_dicts)
+                    if cd.get("status") != UNFINISHED
+                    and (
+                        cd["clinically_significant"] is None
                         or cd["clinically_insignificant"] is None
-                        else 0
                     )
-                    for cd in completion_dicts
                 ]
+                if len(to_retry) == 0:
+                    break
+
+                logging.warning(f"Found {len(to_retry)} invalid ratings. Retrying...")
+                responses = await self.generate_openai_batch_chat_completion(
+                    [formatted_prompts[i] for i in to_retry],
+                    scheduler=scheduler,
+                    job_name=job_name,
+                    run_control=run_control,
+                )
+                for i, response in zip(to_retry, responses):
+                    if response is None:
+                        continue
+                    significant, insignificant = extract_rating_dicts(response)
+                    completion_dicts[i]["clinically_significant"] = significant
+                    completion_dicts[i]["clinically_insignificant"] = insignificant
+                num_retries += 1
+
+        if owns_job:
+            (scheduler or self._default_scheduler()).remove_job(job_name)
+
+        return completion_dicts
+
+    def _default_scheduler(self) -> EvaluationScheduler:
+        """Returns the scheduler used when none is given, drawing from `rate_limiter`."""
+        if self._scheduler is None:
+            self._scheduler = EvaluationScheduler(
+                requests_per_minute=self.requests_per_minute,
+                limiter=self.rate_limiter,
             )
-            if self.max_retries > 0 and n_to_retry > 0:
-                while num_retries < self.max_retries:
-                    logging.warning(f"Found {n_to_retry} invalid ratings. Retrying...")
-                    for fp, cd in zip(formatted_prompts, completion_dicts):
-                        if (
-                            cd["clinically_significant"] is None
-                            or cd["clinically_insignificant"] is None
-                        ):
-                            response = self.generate_openai_chat_completion(fp)
-                            significant, insignificant = extract_rating_dicts(response)
-                            cd["clinically_significant"] = significant
-                            cd["clinically_insignificant"] = insignificant
-                    num_retries += 1
-                    if all(
-                        cd["clinically_significant"] is not None
-                        and cd["clinically_insignificant"] is not None
-                        for cd in completion_dicts
-                    ):
-                        break
+        return self._scheduler
 
-            results = completion_dicts
+    def _new_job_name(self) -> str:
+        """Returns a scheduler job name unique to one evaluation call."""
+        return f"{self.engine}-{next(_job_ids)}"
 
-        return results
+    def _format_prompts(
+        self,
+        references: List[str] | str,
+        candidates: List[str] | str,
+    ) -> List[List[Dict[str, str]]]:
+        """Format the reference and candidate pairs into full prompts."""
+
+        if isinstance(references, str):
+            references = [references]
+        if isinstance(candidates, str):
+            candidates = [candidates]
+
+        formatted_prompts = []
+        for reference, candidate in zip(references, candidates):
+            system_prompt, user_prompt = self.format_for_evaluation(
+                reference, candidate
+            )
+            formatted_prompts.append(format_full_prompt(system_prompt, user_prompt))
+
+        return formatted_prompts
 
     def _evaluate_one(
         self,
         formatted_prompt: str,
+        limiter: ThreadSafeRateLimiter | None = None,
     ) -> Dict[str, Dict[str, int]]:
         """Evaluate the candidate against the reference.
 
         Args:
         - formatted_prompt: str, the prompt for evaluation
+        - limiter: ThreadSafeRateLimiter | None, if set, requests are rate limited and
+            API errors are retried with the same policy as the async API
 
         Returns:
         - result: Dict[str, Dict[str, int]], the evaluation result
         """
 
-        response = self.generate_openai_chat_completion(formatted_prompt)
+        def _generate(prompt):
+            if limiter is None:
+                return self.generate_openai_chat_completion(prompt)
+            return self._throttled_openai_chat_completion_create(prompt, limiter)
+
+        response = _generate(formatted_prompt)
 
         significant, insignificant = extract_rating_dicts(response)
 
         num_retries = 0
 
-        if significant is None or insignificant is None and self.max_retries > 0:
+        if (significant is None or insignificant is None) and self.max_retries > 0:
             while num_retries < self.max_retries:
-                response = self.generate_openai_chat_completion(full_prompt)
+                response = _generate(formatted_prompt)
                 significant, insignificant = extract_rating_dicts(response)
                 num_retries += 1
                 if significant is not None and insignificant is not None:
@@ -238,7 +582,7 @@ class ReportEvaluator:
     def generate_openai_chat_completion(
         self, formatted_prompt: List[Dict[str, str]]
     ) -> Dict[str, str]:
-
+        self._count_api_call()
         return openai.ChatCompletion.create(
             engine=self.engine,
             messages=formatted_prompt,
@@ -248,16 +592,18 @@ class ReportEvaluator:
             frequency_penalty=self.frequency_penalty,
             presence_penalty=self.presence_penalty,
             stop=self.stop,
+            request_timeout=self.request_timeout,
         )
 
     async def generate_openai_chat_completion_async(
         self,
         formatted_prompt: List[Dict[str, str]],
+        engine: str | None = None,
         **kwargs,
     ) -> Dict[str, str]:
-
+        self._count_api_call()
         return await openai.ChatCompletion.acreate(
-            engine=self.engine,
+            engine=engine or self.engine,
             messages=formatted_prompt,
             temperature=self.temperature,
             max_tokens=self.max_tokens,
@@ -268,77 +614,300 @@ class ReportEvaluator:
             **kwargs,
         )
 
+    def _count_api_call(self) -> None:
+        with self._api_calls_lock:
+            self.api_calls += 1
+
     async def _throttled_openai_chat_completion_acreate(
         self,
         formatted_prompt: List[Dict[str, str]],
-        limiter: aiolimiter.AsyncLimiter,
+        scheduler: EvaluationScheduler,
+        job_name: str,
+        owner: Any = None,
         **kwargs,
     ) -> Dict[str, Any]:
-        async with limiter:
+        prompt_length = sum(len(message["content"]) for message in formatted_prompt)
+        async with scheduler.slot(job_name, size=prompt_length, owner=owner):
             for trial_count in range(5):
                 try:
-                    return await self.generate_openai_chat_completion_async(
-                        formatted_prompt, **kwargs
-                    )
-                except openai.error.RateLimitError as e:
-                    sleep_time = int(
-                        str(e).split("Please retry after ")[1].split()[0]
-                    ) + 30 * (1 + trial_count**2)
-                    logging.warning(
-                        f"OpenAI API rate limit exceeded trial#{trial_count}. Sleeping for {sleep_time} seconds."
+                    return await self._hedged_openai_chat_completion_acreate(
+                        formatted_prompt, scheduler, **kwargs
                     )
+                except openai.error.InvalidRequestError:
+                    logging.warning("OpenAI API Invalid Request: Prompt was filtered")
+                    return copy.deepcopy(FILTERED_RESPONSE)
+                except RETRIED_ERRORS as e:
+                    sleep_time = self._retry_delay(e, trial_count)
+                    if sleep_time is None:
+                        break
                     await asyncio.sleep(sleep_time)
-                except asyncio.exceptions.TimeoutError as e:
-                    logging.warning(
-                        str(e) + "\n" + "OpenAI API timeout. Sleeping for 10 seconds."
-                    )
-                    await asyncio.sleep(10)
+            return copy.deepcopy(EMPTY_RESPONSE)
+
+    def _throttled_openai_chat_completion_create(
+        self,
+        formatted_prompt: List[Dict[str, str]],
+        limiter: ThreadSafeRateLimiter,
+    ) -> Dict[str, Any]:
+        with limiter:
+            for trial_count in range(5):
+                try:
+                    return self.generate_openai_chat_completion(formatted_prompt)
                 except openai.error.InvalidRequestError:
                     logging.warning("OpenAI API Invalid Request: Prompt was filtered")
-                    return {
-                        "choices": [
-                            {
-                                "message": {
-                                    "content": "Invalid Request: Prompt was filtered"
-                                }
-                            }
-                        ]
-                    }
-                except openai.error.APIConnectionError:
-                    logging.warning(
-                        "OpenAI API Connection Error: Error Communicating with OpenAI"
+                    return copy.deepcopy(FILTERED_RESPONSE)
+                except RETRIED_ERRORS as e:
+                    sleep_time = self._retry_delay(e, trial_count)
+                    if sleep_time is None:
+                        break
+                    time.sleep(sleep_time)
+            return copy.deepcopy(EMPTY_RESPONSE)
+
+    def _retry_delay(self, error: Exception, trial_count: int) -> float | None:
+        """Returns the seconds to wait before retrying a failed request, or None to give up."""
+        if isinstance(error, openai.error.RateLimitError):
+            sleep_time = int(
+                str(error).split("Please retry after ")[1].split()[0]
+            ) + 30 * (1 + trial_count**2)
+            logging.warning(
+                f"OpenAI API rate limit exceeded trial#{trial_count}. Sleeping for {sleep_time} seconds."
+            )
+            return sleep_time
+        elif (
+            isinstance(error, (asyncio.exceptions.TimeoutError, openai.error.Timeout))
+            and self.request_timeout is not None
+        ):
+            # The deadline already spent the time, retry right away.
+            logging.warning(
+                f"OpenAI API request exceeded its {self.request_timeout} seconds deadline. Retrying."
+            )
+            return 0
+        elif isinstance(error, asyncio.exceptions.TimeoutError):
+            logging.warning(
+                str(error) + "\n" + "OpenAI API timeout. Sleeping for 10 seconds."
+            )
+            return 10
+        elif isinstance(error, openai.error.APIConnectionError):
+            logging.warning(
+                "OpenAI API Connection Error: Error Communicating with OpenAI"
+            )
+            return 10
+        elif isinstance(error, openai.error.Timeout):
+            logging.warning(
+                str(error) + "\n" + "OpenAI APITimeout Error: OpenAI Timeout"
+            )
+            return 10
+
+        logging.warning(f"OpenAI API error: {error}")
+        return None
+
+    async def _hedged_openai_chat_completion_acreate(
+        self,
+        formatted_prompt: List[Dict[str, str]],
+        scheduler: EvaluationScheduler,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """Request a chat completion within `request_timeout`, hedging slow requests.
+
+        If hedging is enabled and the request is still running after the
+        `hedge_percentile` of recent latencies, a duplicate request is sent, to
+        `hedge_engine` if set. The first response wins and the other request is
+        cancelled. Hedges are limited to a `hedge_budget` fraction of requests and,
+        when sent to the same engine, to the quota left in the scheduler.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = (
+            loop.time() + self.request_timeout
+            if self.request_timeout is not None
+            else None
+        )
+
+        def _remaining() -> float | None:
+            return None if deadline is None else max(0.0, deadline - loop.time())
+
+        start_times = {}
+
+        def _start_request(engine: str | None) -> asyncio.Task:
+            task = asyncio.create_task(
+                self.generate_openai_chat_completion_async(
+                    formatted_prompt, engine=engine, **kwargs
+                )
+            )
+            start_times[task] = loop.time()
+            return task
+
+        self.hedge_budget.record_request()
+        primary = _start_request(None)
+        pending = {primary}
+        try:
+            hedge_delay = (
+                self.latency_tracker.percentile(self.hedge_percentile)
+                if self.hedge_percentile is not None
+                else None
+            )
+            if hedge_delay is not None and (
+                deadline is None or hedge_delay < _remaining()
+            ):
+                done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+                if not done and self._can_hedge(scheduler):
+                    logging.debug(
+                        f"Request exceeded {hedge_delay:.1f} seconds. Sending a hedged request."
                     )
-                    await asyncio.sleep(10)
-                except openai.error.Timeout as e:
+                    pending.add(_start_request(self.hedge_engine))
+
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=_remaining(), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise asyncio.TimeoutError()
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    self.latency_tracker.add(loop.time() - start_times[task])
+                    if task is not primary:
+                        self.hedge_budget.record_hedge_win()
+                    return task.result()
+            raise error
+        finally:
+            # Requests cancelled before responding, because they lost the race or
+            # missed the deadline, would have taken at least as long as they ran.
+            for task in pending:
+                task.cancel()
+                self.latency_tracker.add(
+                    loop.time() - start_times[task], censored=True
+                )
+
+    def _can_hedge(self, scheduler: EvaluationScheduler) -> bool:
+        """Returns True if a hedged request fits in the hedge budget and the quota."""
+        if not self.hedge_budget.can_spend():
+            return False
+        if self.hedge_engine is None or self.hedge_engine == self.engine:
+            if not scheduler.try_acquire():
+                return False
+        self.hedge_budget.record_hedge()
+        return True
+
+    async def _gather_until_stopped(
+        self,
+        tasks: List[asyncio.Task],
+        scheduler: EvaluationScheduler,
+        job_name: str,
+        run_control: RunControl,
+    ) -> List[Dict[str, Any] | None]:
+        """Wait for all tasks, or until the run is stopped.
+
+        On stop, waiting requests are dropped and in-flight requests are given
+        `grace_period` seconds to finish before they are cancelled. The responses
+        of the requests that did not finish are None.
+        """
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        run_control.add_callback(lambda: loop.call_soon_threadsafe(wake.set))
+
+        all_done = asyncio.gather(*tasks, return_exceptions=True)
+        wake_task = asyncio.create_task(wake.wait())
+        try:
+            await asyncio.wait(
+                [all_done, wake_task], return_when=asyncio.FIRST_COMPLETED
+            )
+            if not all_done.done():
+                # Other runs may share the job, only this run's requests are dropped.
+                scheduler.cancel_waiting(job_name, owner=run_control)
+                if not run_control.forced.is_set():
                     logging.warning(
-                        str(e) + "\n" + "OpenAI APITimeout Error: OpenAI Timeout"
+                        f"Waiting up to {self.grace_period} seconds for in-flight requests."
                     )
-                    await asyncio.sleep(10)
-                except openai.error.APIError as e:
-                    logging.warning(f"OpenAI API error: {e}")
-                    break
-            return {"choices": [{"message": {"content": ""}}]}
+                    wake.clear()
+                    wake_task = asyncio.create_task(wake.wait())
+                    await asyncio.wait(
+                        [all_done, wake_task],
+                        timeout=self.grace_period,
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                for task in tasks:
+                    task.cancel()
+                await all_done
+        finally:
+            wake_task.cancel()
+
+        responses = []
+        for task in tasks:
+            if task.cancelled():
+                responses.append(None)
+            elif task.exception() is not None:
+                raise task.exception()
+            else:
+                responses.append(task.result())
+
+        return responses
 
     async def generate_openai_batch_chat_completion(
-        self, formatted_prompts: List, **kwargs
+        self,
+        formatted_prompts: List,
+        scheduler: EvaluationScheduler | None = None,
+        job_name: str | None = None,
+        run_control: RunControl | None = None,
+        **kwargs,
     ) -> List[Dict[str, Dict[str, int] | None]]:
         """Generate from OpenAI Chat Completion API.
 
         Args:
             formatted_prompts: List of formatted prompts generate from.
+            scheduler: Scheduler shared with other jobs, or None to use the evaluator's own scheduler.
+            job_name: Scheduler job to submit the requests to, defaults to a new job for this batch.
+            run_control: Stops the batch early; the responses of unfinished requests are None.
         Returns:
             List of generated responses.
         """
-        openai.aiosession.set(ClientSession())
-        limiter = aiolimiter.AsyncLimiter(self.requests_per_minute)
-        async_responses = [
-            self._throttled_openai_chat_completion_acreate(
-                formatted_prompt=p, limiter=limiter, **kwargs
-            )
-            for p in formatted_prompts
-        ]
-        responses = await tqdm_asyncio.gather(*async_responses)
+        if scheduler is None:
+            scheduler = self._default_scheduler()
+        owns_job = job_name is None
+        if owns_job:
+            job_name = self._new_job_name()
 
-        await openai.aiosession.get().close()
+        openai.aiosession.set(ClientSession())
+        try:
+            tasks = [
+                asyncio.create_task(
+                    self._throttled_openai_chat_completion_acreate(
+                        formatted_prompt=p,
+                        scheduler=scheduler,
+                        job_name=job_name,
+                        owner=run_control,
+                        **kwargs,
+                    )
+                )
+                for p in formatted_prompts
+            ]
+            if run_control is None:
+                responses = await asyncio.gather(*tasks)
+            else:
+                responses = await self._gather_until_stopped(
+                    tasks, scheduler, job_name, run_control
+                )
+        finally:
+            await openai.aiosession.get().close()
+            if owns_job:
+                scheduler.remove_job(job_name)
 
         return responses
+
+
+def _is_event_loop_running() -> bool:
+    """Returns True if called from a running event loop, e.g. in a notebook."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _unfinished_result() -> Dict[str, Any]:
+    """Result of a report that was not rated because the run was stopped."""
+    return {
+        "clinically_significant": None,
+        "clinically_insignificant": None,
+        "status": UNFINISHED,
+    }
@@ -0,0 +1,97 @@
+import math
+from collections import deque
+
+
+class LatencyTracker:
+    """Tracks the latency of recent requests to estimate its percentiles online.
+
+    Requests that are cancelled before responding, e.g. the loser of a hedge, are
+    recorded as censored: their latency is only known to exceed the recorded time.
+    Percentiles are estimated with the Kaplan-Meier estimator, so that cancelled
+    slow requests still count towards the tail.
+
+    Args:
+    - window_size: int, the number of most recent latencies to keep
+    - min_samples: int, the number of latencies needed before percentiles are estimated
+    """
+
+    def __init__(self, window_size: int = 500, min_samples: int = 20) -> None:
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window_size)
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def add(self, latency: float, censored: bool = False) -> None:
+        """Record the latency of a request, in seconds.
+
+        Args:
+        - latency: float, the time until the response, or until cancellation if censored
+        - censored: bool, True if the request was cancelled before responding
+        """
+        self._latencies.append((latency, censored))
+
+    def percentile(self, q: float) -> float | None:
+        """Returns the q-th quantile (0 < q < 1) of the recent latencies, or None if too few were recorded."""
+        if not 0 < q < 1:
+            raise ValueError("Quantile must be between 0 and 1.")
+        if len(self._latencies) < max(1, self.min_samples):
+            return None
+
+        # Censored latencies sort after responses of the same time, as they are lower bounds.
+        latencies = sorted(self._latencies)
+        n_at_risk = len(latencies)
+        survival = 1.0
+        for latency, censored in latencies:
+            if not censored:
+                survival *= 1 - 1 / n_at_risk
+                # Tolerate rounding, so that e.g. the median of 10 values is the 5th.
+                if survival <= 1 - q + 1e-9:
+                    return latency
+            n_at_risk -= 1
+
+        # The quantile lies beyond the longest observation, which is a lower bound of it.
+        return latencies[-1][0]
+
+
+class HedgeBudget:
+    """Limits hedged requests to a fraction of requests, with a token bucket.
+
+    Every request adds `max_fraction` of a token, up to `burst` tokens, and every
+    hedge spends one. Unused budget therefore does not pile up over long or
+    repeated runs.
+
+    Args:
+    - max_fraction: float, the maximum number of hedges per issued request
+    - burst: float, the maximum number of hedges that can be saved up
+    """
+
+    def __init__(self, max_fraction: float = 0.1, burst: float = 5.0) -> None:
+        self.max_fraction = max_fraction
+        self.burst = burst
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        # Credit is counted in requests, so that it adds up without rounding errors.
+        self._hedge_cost = 1 / max_fraction if max_fraction > 0 else math.inf
+        self._credit = 0.0
+
+    @property
+    def tokens(self) -> float:
+        """The number of hedges that the budget currently allows."""
+        return self._credit / self._hedge_cost
+
+    def record_request(self) -> None:
+        self.requests += 1
+        self._credit = min(self.burst * self._hedge_cost, self._credit + 1)
+
+    def can_spend(self) -> bool:
+        """Returns True if the budget allows one more hedge."""
+        return self._credit >= self._hedge_cost
+
+    def record_hedge(self) -> None:
+        self.hedges += 1
+        self._credit -= self._hedge_cost
+
+    def record_hedge_win(self) -> None:
+        self.hedge_wins += 1
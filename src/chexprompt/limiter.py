@@ -0,0 +1,78 @@
+import threading
+import time
+from types import TracebackType
+from typing import Optional, Type
+
+
+class ThreadSafeRateLimiter:
+    """A leaky bucket rate limiter that can be shared between threads and event loops.
+
+    Up to `max_rate` acquisitions are allowed in a burst, and capacity drips back
+    at `max_rate / time_period` per second. `acquire` blocks the calling thread;
+    async code polls `try_acquire` and sleeps for `time_until_capacity` instead.
+
+    Usage:
+        limiter = ThreadSafeRateLimiter(30)
+        with limiter:
+            # at most 30 requests per minute across all threads
+
+    Args:
+    - max_rate: float, the number of acquisitions allowed per time period
+    - time_period: float, the duration of the time period in seconds
+    """
+
+    def __init__(self, max_rate: float, time_period: float = 60) -> None:
+        self.max_rate = max_rate
+        self.time_period = time_period
+        self._rate_per_sec = max_rate / time_period
+        self._level = 0.0
+        self._last_check = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _leak(self) -> None:
+        now = time.monotonic()
+        self._level = max(
+            0.0, self._level - (now - self._last_check) * self._rate_per_sec
+        )
+        self._last_check = now
+
+    def has_capacity(self, amount: float = 1) -> bool:
+        with self._lock:
+            self._leak()
+            return self._level + amount <= self.max_rate
+
+    def try_acquire(self, amount: float = 1) -> bool:
+        """Acquire capacity only if it is available without waiting."""
+        with self._lock:
+            self._leak()
+            if self._level + amount <= self.max_rate:
+                self._level += amount
+                return True
+            return False
+
+    def time_until_capacity(self, amount: float = 1) -> float:
+        """Returns the seconds until `amount` of capacity is available."""
+        with self._lock:
+            self._leak()
+            return max(
+                0.0, (self._level + amount - self.max_rate) / self._rate_per_sec
+            )
+
+    def acquire(self, amount: float = 1) -> None:
+        """Acquire capacity, blocking until enough of it has dripped out of the bucket."""
+        if amount > self.max_rate:
+            raise ValueError("Can't acquire more than the maximum capacity")
+
+        while not self.try_acquire(amount):
+            time.sleep(self.time_until_capacity(amount))
+
+    def __enter__(self) -> None:
+        self.acquire()
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        return None
@@ -67,10 +67,52 @@ def parse_args() -> argparse.Namespace:
     )
     parser.add_argument(
         "--use_async",
-        type=bool,
+        action=argparse.BooleanOptionalAction,
         default=True,
         help="Use async API for faster processing",
     )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=None,
+        help="Send requests from this many threads instead of using the async API",
+    )
+    parser.add_argument(
+        "--request_timeout",
+        type=float,
+        default=None,
+        help="The deadline of a single request in seconds, after which it is retried",
+    )
+    parser.add_argument(
+        "--hedge_percentile",
+        type=float,
+        default=None,
+        help="Send a duplicate of requests slower than this latency percentile (e.g. 0.95)",
+    )
+    parser.add_argument(
+        "--hedge_engine",
+        type=str,
+        default=None,
+        help="The deployment to send hedged requests to, defaults to --engine",
+    )
+    parser.add_argument(
+        "--hedge_budget",
+        type=float,
+        default=0.1,
+        help="The maximum fraction of requests that can be hedged",
+    )
+    parser.add_argument(
+        "--time_budget",
+        type=float,
+        default=None,
+        help="The wall-clock budget of the run in seconds, after which completed ratings are saved",
+    )
+    parser.add_argument(
+        "--grace_period",
+        type=float,
+        default=30.0,
+        help="Seconds to wait for in-flight requests when the run is stopped",
+    )
     args = parser.parse_args()
     if args.rating_name == "":
         raise ValueError("Rating name cannot be empty.")
@@ -87,7 +129,14 @@ def main():
         max_tokens=args.max_tokens,
         top_p=args.top_p,
         requests_per_minute=args.max_request_per_min,
-        use_async=args.use_async,
+        use_async=args.use_async and args.num_workers is None,
+        num_workers=args.num_workers,
+        request_timeout=args.request_timeout,
+        hedge_percentile=args.hedge_percentile,
+        hedge_engine=args.hedge_engine,
+        hedge_budget=args.hedge_budget,
+        time_budget=args.time_budget,
+        grace_period=args.grace_period,
     )
 
     references_candidates_dicts = load_reports_to_rate(args.input_fpath)
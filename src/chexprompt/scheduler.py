@@ -0,0 +1,359 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import time
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from tqdm import tqdm
+
+from chexprompt.limiter import ThreadSafeRateLimiter
+
+
+class JobStats:
+    """Progress and throughput of a single job submitted to an `EvaluationScheduler`."""
+
+    def __init__(self, name: str, weight: float = 1.0, priority: int = 0) -> None:
+        self.name = name
+        self.weight = weight
+        self.priority = priority
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.start_time: float | None = None
+        self.end_time: float | None = None
+
+    @property
+    def pending(self) -> int:
+        """Number of submitted requests that have not finished yet."""
+        return self.submitted - self.completed - self.failed
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds between the first submission and the last completion (or now)."""
+        if self.start_time is None:
+            return 0.0
+        if self.pending == 0 and self.end_time is not None:
+            return self.end_time - self.start_time
+        return time.monotonic() - self.start_time
+
+    @property
+    def requests_per_minute(self) -> float:
+        """Observed throughput of the job, in finished requests per minute."""
+        if self.elapsed <= 0:
+            return 0.0
+        return 60.0 * (self.completed + self.failed) / self.elapsed
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "weight": self.weight,
+            "priority": self.priority,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "pending": self.pending,
+            "elapsed": self.elapsed,
+            "requests_per_minute": self.requests_per_minute,
+        }
+
+
+class _Job:
+    """Internal queue state of a job."""
+
+    def __init__(self, stats: JobStats, position: int) -> None:
+        self.stats = stats
+        self.position = position
+        self.queue: List[Tuple[int, int, asyncio.Future, Any]] = []
+        self.virtual_time = 0.0
+        self.progress_bar: tqdm | None = None
+
+    def has_waiting(self) -> bool:
+        while self.queue and self.queue[0][2].done():
+            heapq.heappop(self.queue)
+        return len(self.queue) > 0
+
+
+class EvaluationScheduler:
+    """Shares one request quota between several evaluation jobs.
+
+    Requests submitted by different jobs (e.g. one `ReportEvaluator.evaluate_async`
+    call per rated system) are dispatched under a single global rate limit. Jobs with
+    a higher `priority` are always served first; jobs of equal priority share the
+    quota in proportion to their `weight` (start-time fair queuing). Within a job,
+    requests are served in submission order, or shortest prompt first if
+    `shortest_prompt_first` is set, which lowers the mean latency of a job.
+
+    Args:
+    - requests_per_minute: int, the global request quota shared by all jobs
+    - max_concurrency: int | None, the maximum number of in-flight requests, or None for no limit
+    - shortest_prompt_first: bool, serve the shortest waiting prompt of a job first
+    - show_progress: bool, display a progress bar with throughput for each job
+    - limiter: ThreadSafeRateLimiter | None, the quota to draw from, e.g. shared with
+        other schedulers or threads; if None, a quota of `requests_per_minute` is used
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = 30,
+        max_concurrency: int | None = None,
+        shortest_prompt_first: bool = False,
+        show_progress: bool = True,
+        limiter: ThreadSafeRateLimiter | None = None,
+    ) -> None:
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrency = max_concurrency
+        self.shortest_prompt_first = shortest_prompt_first
+        self.show_progress = show_progress
+
+        # The limiter is not bound to an event loop, so the quota carries over
+        # when the scheduler is reused across `asyncio.run` calls.
+        self._limiter = (
+            limiter
+            if limiter is not None
+            else ThreadSafeRateLimiter(requests_per_minute)
+        )
+        self._jobs: Dict[str, _Job] = {}
+        self._counter = itertools.count()
+        self._virtual_clock = 0.0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._dispatcher: asyncio.Task | None = None
+        self._waiting: asyncio.Event | None = None
+        self._slots: asyncio.Semaphore | None = None
+        # A quota token taken by the dispatcher but not used by a request yet.
+        self._has_token = False
+
+    def add_job(self, name: str, weight: float = 1.0, priority: int = 0) -> JobStats:
+        """Register a job, or update the weight and priority of an existing one.
+
+        Args:
+        - name: str, the job name used when submitting requests
+        - weight: float, the share of the quota relative to other jobs of the same priority
+        - priority: int, jobs with a higher priority are served first
+
+        Returns:
+        - stats: JobStats, the live progress of the job
+        """
+        if weight <= 0:
+            raise ValueError("Job weight must be positive.")
+
+        if name in self._jobs:
+            stats = self._jobs[name].stats
+            stats.weight = weight
+            stats.priority = priority
+            return stats
+
+        stats = JobStats(name, weight=weight, priority=priority)
+        positions = {job.position for job in self._jobs.values()}
+        position = next(i for i in itertools.count() if i not in positions)
+        self._jobs[name] = _Job(stats, position=position)
+        return stats
+
+    def remove_job(self, name: str) -> None:
+        """Forget a job that has no pending requests and close its progress bar."""
+        job = self._jobs.get(name)
+        if job is None or job.stats.pending > 0:
+            return
+        if job.progress_bar is not None:
+            job.progress_bar.close()
+        del self._jobs[name]
+
+    def progress(self) -> Dict[str, JobStats]:
+        """Returns the progress of every registered job, keyed by job name."""
+        return {name: job.stats for name, job in self._jobs.items()}
+
+    @contextlib.asynccontextmanager
+    async def slot(
+        self, job_name: str, size: int = 0, owner: Any = None
+    ) -> AsyncIterator[None]:
+        """Wait for the scheduler to dispatch a request of a job, then hold its slot.
+
+        Usage:
+            async with scheduler.slot("system_a", size=len(prompt)):
+                response = await ...
+
+        Args:
+        - job_name: str, the job the request belongs to; registered with default settings if unknown
+        - size: int, the prompt length, used for shortest-prompt-first ordering
+        - owner: Any, tags the request, e.g. with the run it belongs to, for `cancel_waiting`
+        """
+        self._ensure_started()
+
+        if job_name not in self._jobs:
+            self.add_job(job_name)
+        job = self._jobs[job_name]
+        stats = job.stats
+
+        if not job.has_waiting():
+            # A job returning from idle does not get credit for the time it was idle.
+            job.virtual_time = max(job.virtual_time, self._virtual_clock)
+
+        grant = self._loop.create_future()
+        sort_key = size if self.shortest_prompt_first else 0
+        heapq.heappush(job.queue, (sort_key, next(self._counter), grant, owner))
+
+        if stats.start_time is None:
+            stats.start_time = time.monotonic()
+        stats.submitted += 1
+        self._update_progress_bar(job, total_changed=True)
+        self._waiting.set()
+
+        try:
+            await grant
+        except asyncio.CancelledError:
+            if grant.done() and not grant.cancelled() and self._slots is not None:
+                # Cancelled after the slot was granted but before running.
+                self._slots.release()
+            stats.failed += 1
+            self._update_progress_bar(job)
+            raise
+
+        try:
+            yield
+        except BaseException:
+            stats.failed += 1
+            raise
+        else:
+            stats.completed += 1
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+            stats.end_time = time.monotonic()
+            self._update_progress_bar(job)
+
+    def cancel_waiting(self, job_name: str, owner: Any = None) -> int:
+        """Drop the requests of a job that are still waiting to be dispatched.
+
+        The `slot` calls of the dropped requests raise `asyncio.CancelledError`;
+        requests that are already running are not affected.
+
+        Args:
+        - job_name: str, the job whose waiting requests are dropped
+        - owner: Any, drop only the requests submitted with this owner, or all if None
+
+        Returns:
+        - n_cancelled: int, the number of dropped requests
+        """
+        job = self._jobs.get(job_name)
+        if job is None:
+            return 0
+
+        n_cancelled = 0
+        kept = []
+        for entry in job.queue:
+            grant, entry_owner = entry[2], entry[3]
+            if owner is not None and entry_owner is not owner:
+                kept.append(entry)
+            elif not grant.done():
+                grant.cancel()
+                n_cancelled += 1
+        heapq.heapify(kept)
+        job.queue = kept
+
+        return n_cancelled
+
+    def try_acquire(self) -> bool:
+        """Take one request from the global quota, only if it is available without waiting."""
+        return self._limiter.try_acquire()
+
+    async def close(self) -> None:
+        """Stop dispatching and close the progress bars."""
+        if self._dispatcher is not None and not self._dispatcher.done():
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+        self._dispatcher = None
+
+        for job in self._jobs.values():
+            if job.progress_bar is not None:
+                job.progress_bar.close()
+                job.progress_bar = None
+
+    async def __aenter__(self) -> "EvaluationScheduler":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def _ensure_started(self) -> None:
+        """Start the dispatcher on the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # The scheduler can be reused across `asyncio.run` calls, but its
+            # synchronization primitives are bound to a single loop.
+            self._loop = loop
+            self._waiting = asyncio.Event()
+            self._slots = (
+                asyncio.Semaphore(self.max_concurrency)
+                if self.max_concurrency is not None
+                else None
+            )
+            self._dispatcher = None
+            for job in self._jobs.values():
+                job.queue = []
+
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = loop.create_task(self._dispatch())
+
+    def _next_job(self) -> _Job | None:
+        """Select the job to serve next: highest priority, then lowest virtual time."""
+        candidates = [job for job in self._jobs.values() if job.has_waiting()]
+        if len(candidates) == 0:
+            return None
+
+        return min(
+            candidates,
+            key=lambda job: (-job.stats.priority, job.virtual_time, job.position),
+        )
+
+    async def _dispatch(self) -> None:
+        while True:
+            await self._waiting.wait()
+            if self._next_job() is None:
+                self._waiting.clear()
+                continue
+
+            if self._slots is not None:
+                await self._slots.acquire()
+            while not self._has_token:
+                if self._limiter.try_acquire():
+                    self._has_token = True
+                else:
+                    await asyncio.sleep(self._limiter.time_until_capacity())
+
+            # The job is selected only once capacity is available, so that requests
+            # submitted while waiting for the quota are taken into account. If the
+            # waiting requests were cancelled meanwhile, the token is kept for the next one.
+            job = self._next_job()
+            if job is None:
+                if self._slots is not None:
+                    self._slots.release()
+                continue
+
+            self._has_token = False
+            grant = heapq.heappop(job.queue)[2]
+            self._virtual_clock = job.virtual_time
+            job.virtual_time += 1.0 / job.stats.weight
+            grant.set_result(None)
+
+    def _update_progress_bar(self, job: _Job, total_changed: bool = False) -> None:
+        """Update the bar of a job after a request was submitted or finished."""
+        if not self.show_progress:
+            return
+
+        stats = job.stats
+        if job.progress_bar is None:
+            job.progress_bar = tqdm(
+                total=stats.submitted, desc=stats.name, position=job.position
+            )
+
+        if total_changed:
+            job.progress_bar.total = stats.submitted
+            return
+
+        job.progress_bar.set_postfix(
+            rpm=f"{stats.requests_per_minute:.1f}", failed=stats.failed, refresh=False
+        )
+        job.progress_bar.update(1)
@@ -0,0 +1,340 @@
+import asyncio
+import itertools
+import logging
+import math
+import random
+from statistics import NormalDist
+from typing import Any, Dict, List, Tuple
+
+from chexprompt.eval_utils import count_errors
+from chexprompt.evaluator import UNFINISHED, ReportEvaluator, _is_event_loop_running
+from chexprompt.scheduler import EvaluationScheduler
+
+
+class RunningMean:
+    """Running mean and variance of a stream of values (Welford's algorithm)."""
+
+    def __init__(self) -> None:
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value: float) -> None:
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self) -> float:
+        """Unbiased sample variance, 0 with fewer than two values."""
+        if self.n < 2:
+            return 0.0
+        return self._m2 / (self.n - 1)
+
+    def confidence_interval(self, alpha: float) -> Tuple[float, float]:
+        """Two-sided normal-approximation confidence interval of the mean at level 1 - alpha.
+
+        Error counts are integers, so the variance is floored at 1 / n, the variance of
+        a sample with a single unit deviation: a sample without variation is not taken
+        as certain. With fewer than two values the interval is unbounded.
+        """
+        if self.n < 2:
+            return -math.inf, math.inf
+        z = NormalDist().inv_cdf(1 - alpha / 2)
+        variance = max(self.variance, 1 / self.n)
+        half_width = z * math.sqrt(variance / self.n)
+        return self.mean - half_width, self.mean + half_width
+
+
+class SequentialEvaluator:
+    """Compares report generators by rating randomly ordered batches until a target is met.
+
+    Every system is rated on the same reports, in batches of `batch_size` drawn in a
+    random order. After each batch, the mean number of errors per report is updated for
+    every system, as well as the paired difference between every two systems. Rating
+    stops as soon as one of the targets is reached:
+
+    - precision: the confidence intervals of all system means and pairwise differences
+      have a half-width of at most `precision` errors per report;
+    - significance: the confidence intervals of all pairwise differences exclude zero.
+
+    The evaluator's `time_budget` applies to the whole comparison, and `cancel` or
+    a signal stops it, also between batches; the stop reason is then "cancelled".
+
+    When the evaluator uses the async API, all batches run on one event loop and
+    every system is a separate job of one `EvaluationScheduler`, so the systems share
+    the evaluator's quota fairly.
+
+    Intervals use a normal approximation. Since the data are looked at after every
+    batch, `alpha` is split over the maximum number of looks and the number of
+    compared pairs (Bonferroni), so the overall error rate stays below `alpha`.
+
+    Args:
+    - evaluator: ReportEvaluator, the evaluator used to rate the reports
+    - batch_size: int, the number of reports rated per system between two looks
+    - alpha: float, the overall significance level of the intervals
+    - precision: float | None, the target half-width of the intervals, or None to disable
+    - stop_on_significance: bool, stop once all pairwise differences are significant
+    - min_reports: int, the number of valid ratings per system and pair needed before stopping is allowed
+    - metric: str, the rating to compare, "clinically_significant" or "clinically_insignificant"
+    - seed: int | None, the seed of the random order of the reports
+    """
+
+    def __init__(
+        self,
+        evaluator: ReportEvaluator,
+        batch_size: int = 20,
+        alpha: float = 0.05,
+        precision: float | None = None,
+        stop_on_significance: bool = True,
+        min_reports: int = 30,
+        metric: str = "clinically_significant",
+        seed: int | None = None,
+    ) -> None:
+        if batch_size <= 0:
+            raise ValueError("Batch size must be positive.")
+        if not 0 < alpha < 1:
+            raise ValueError("Alpha must be between 0 and 1.")
+
+        self.evaluator = evaluator
+        self.batch_size = batch_size
+        self.alpha = alpha
+        self.precision = precision
+        self.stop_on_significance = stop_on_significance
+        self.min_reports = min_reports
+        self.metric = metric
+        self.seed = seed
+
+    def compare(
+        self,
+        references: List[str],
+        candidates: Dict[str, List[str]],
+    ) -> Dict[str, Any]:
+        """Rate the candidates of every system until a stopping target is reached.
+
+        Args:
+        - references: List[str], the reference, or ground truth reports
+        - candidates: Dict[str, List[str]], the candidate reports of each system, aligned with the references
+
+        Returns:
+        - results: Dict[str, Any], with the keys
+            - "stop_reason": str, "precision", "significance", "exhausted" or "cancelled"
+            - "n_rated": int, the number of reports rated for every system
+            - "n_total": int, the number of reports available per system
+            - "ratings_saved": int, the number of ratings that were not made
+            - "api_calls": int, the number of API calls made, including retries and hedges
+            - "api_calls_saved": int, the estimated number of API calls that rating every
+                report would have added, at the observed number of calls per rating
+            - "systems": per system, the "mean" error count, its "ci" and the number "n" of valid ratings
+            - "differences": per pair "a - b", the "mean" paired difference, its "ci" and whether it is "significant"
+            - "ratings": per system, the list of (report index, rating) pairs that were rated
+        """
+        systems = list(candidates)
+        for system in systems:
+            if len(candidates[system]) != len(references):
+                raise ValueError(
+                    f"System {system} has {len(candidates[system])} candidates "
+                    f"for {len(references)} references."
+                )
+
+        n_total = len(references)
+        order = list(range(n_total))
+        random.Random(self.seed).shuffle(order)
+
+        pairs = list(itertools.combinations(systems, 2))
+        max_looks = max(1, math.ceil(n_total / self.batch_size))
+        alpha_per_look = self.alpha / max_looks / max(1, len(pairs))
+
+        system_stats = {system: RunningMean() for system in systems}
+        difference_stats = {pair: RunningMean() for pair in pairs}
+        ratings = {system: [] for system in systems}
+
+        loop = None
+        scheduler = None
+        if self.evaluator.use_async and not _is_event_loop_running():
+            loop = asyncio.new_event_loop()
+            scheduler = EvaluationScheduler(
+                requests_per_minute=self.evaluator.requests_per_minute,
+                limiter=self.evaluator.rate_limiter,
+            )
+
+        api_calls_before = self.evaluator.api_calls
+        position = 0
+        n_rated = 0
+        n_ratings = 0
+        stop_reason = "exhausted"
+        try:
+            with (
+                self.evaluator._stop_on_signals(),
+                self.evaluator._run_control() as run_control,
+            ):
+                while position < n_total:
+                    if run_control.stopped.is_set():
+                        logging.warning(
+                            f"Evaluation was stopped after {n_rated} of {n_total} reports."
+                        )
+                        stop_reason = "cancelled"
+                        break
+
+                    batch = order[position : position + self.batch_size]
+                    position += len(batch)
+                    batch_ratings = self._rate_batch(
+                        references, candidates, systems, batch, loop, scheduler
+                    )
+
+                    cancelled = False
+                    for j, index in enumerate(batch):
+                        counts = {}
+                        for system in systems:
+                            rating = batch_ratings[system][j]
+                            if rating.get("status") == UNFINISHED:
+                                cancelled = True
+                                counts[system] = None
+                                continue
+                            n_ratings += 1
+                            ratings[system].append((index, rating))
+                            counts[system] = count_errors(rating.get(self.metric))
+                            if counts[system] is not None:
+                                system_stats[system].add(counts[system])
+                        if all(
+                            batch_ratings[system][j].get("status") != UNFINISHED
+                            for system in systems
+                        ):
+                            n_rated += 1
+                        for a, b in pairs:
+                            if counts[a] is not None and counts[b] is not None:
+                                difference_stats[(a, b)].add(counts[a] - counts[b])
+
+                    if cancelled:
+                        logging.warning(
+                            f"Evaluation was stopped after {n_rated} of {n_total} reports."
+                        )
+                        stop_reason = "cancelled"
+                        break
+
+                    if position >= n_total:
+                        continue
+                    all_stats = list(system_stats.values()) + list(
+                        difference_stats.values()
+                    )
+                    if min(stats.n for stats in all_stats) < max(2, self.min_reports):
+                        continue
+
+                    stop_reason = self._check_stop(
+                        system_stats, difference_stats, alpha_per_look
+                    )
+                    if stop_reason is not None:
+                        logging.info(
+                            f"Stopping after {n_rated} of {n_total} reports: {stop_reason} target reached."
+                        )
+                        break
+                    stop_reason = "exhausted"
+        finally:
+            if loop is not None:
+                loop.run_until_complete(scheduler.close())
+                loop.close()
+
+        ratings_saved = n_total * len(systems) - n_ratings
+        api_calls = self.evaluator.api_calls - api_calls_before
+        calls_per_rating = api_calls / n_ratings if n_ratings > 0 else 1.0
+
+        return {
+            "stop_reason": stop_reason,
+            "n_rated": n_rated,
+            "n_total": n_total,
+            "ratings_saved": ratings_saved,
+            "api_calls": api_calls,
+            "api_calls_saved": round(ratings_saved * calls_per_rating),
+            "systems": {
+                system: {
+                    "mean": stats.mean,
+                    "ci": stats.confidence_interval(alpha_per_look),
+                    "n": stats.n,
+                }
+                for system, stats in system_stats.items()
+            },
+            "differences": {
+                f"{a} - {b}": {
+                    "mean": stats.mean,
+                    "ci": stats.confidence_interval(alpha_per_look),
+                    "significant": _excludes_zero(
+                        stats.confidence_interval(alpha_per_look)
+                    ),
+                }
+                for (a, b), stats in difference_stats.items()
+            },
+            "ratings": ratings,
+        }
+
+    def _rate_batch(
+        self,
+        references: List[str],
+        candidates: Dict[str, List[str]],
+        systems: List[str],
+        batch: List[int],
+        loop: asyncio.AbstractEventLoop | None = None,
+        scheduler: EvaluationScheduler | None = None,
+    ) -> Dict[str, List[Dict[str, Dict[str, int]]]]:
+        """Rate a batch of reports for all systems.
+
+        With an event loop, each system is rated by its own `evaluate_async` job on
+        `scheduler`; otherwise all systems are rated in a single `evaluate` call.
+        """
+        if loop is not None:
+
+            async def _rate_systems():
+                return await asyncio.gather(
+                    *[
+                        self.evaluator.evaluate_async(
+                            [references[i] for i in batch],
+                            [candidates[system][i] for i in batch],
+                            scheduler=scheduler,
+                            job_name=system,
+                        )
+                        for system in systems
+                    ]
+                )
+
+            return dict(zip(systems, loop.run_until_complete(_rate_systems())))
+
+        batch_references = [references[i] for i in batch] * len(systems)
+        batch_candidates = [
+            candidates[system][i] for system in systems for i in batch
+        ]
+        results = self.evaluator.evaluate(batch_references, batch_candidates)
+
+        return {
+            system: results[k * len(batch) : (k + 1) * len(batch)]
+            for k, system in enumerate(systems)
+        }
+
+    def _check_stop(
+        self,
+        system_stats: Dict[str, RunningMean],
+        difference_stats: Dict[Tuple[str, str], RunningMean],
+        alpha: float,
+    ) -> str | None:
+        """Returns the reached stopping target, or None to keep rating."""
+
+        difference_intervals = [
+            stats.confidence_interval(alpha) for stats in difference_stats.values()
+        ]
+
+        if self.stop_on_significance and len(difference_intervals) > 0:
+            if all(_excludes_zero(ci) for ci in difference_intervals):
+                return "significance"
+
+        if self.precision is not None:
+            intervals = difference_intervals + [
+                stats.confidence_interval(alpha) for stats in system_stats.values()
+            ]
+            if all((high - low) / 2 <= self.precision for low, high in intervals):
+                return "precision"
+
+        return None
+
+
+def _excludes_zero(interval: Tuple[float, float]) -> bool:
+    low, high = interval
+    return low > 0 or high < 0
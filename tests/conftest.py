@@ -0,0 +1,54 @@
+import asyncio
+import time
+
+import openai
+import pytest
+
+RATING_TEXT = (
+    "Number of clinically significant errors by type: "
+    "((A, {n}), (B, 0), (C, 0), (D, 0), (E, 0), (F, 0))\n"
+    "Number of clinically insignificant errors by type: "
+    "((A, 0), (B, 0), (C, 0), (D, 0), (E, 0), (F, 0))"
+)
+
+
+def candidate_of(messages):
+    """Returns the candidate report of a formatted prompt."""
+    return messages[-1]["content"].split('Candidate Findings: """')[-1].split('"""')[0]
+
+
+def completion_for(messages):
+    """A completion rating the candidate with the number of errors it starts with.
+
+    Candidates look like "<n errors>" or "<n errors> <seconds to respond>".
+    """
+    n_errors = candidate_of(messages).split()[0]
+    return {"choices": [{"message": {"content": RATING_TEXT.format(n=n_errors)}}]}
+
+
+def delay_of(messages) -> float:
+    fields = candidate_of(messages).split()
+    return float(fields[1]) if len(fields) > 1 else 0.0
+
+
+@pytest.fixture
+def mock_openai(monkeypatch):
+    """Replaces the OpenAI chat completion API with a local fake.
+
+    Returns the list of calls, as (engine, candidate) pairs.
+    """
+    calls = []
+
+    async def acreate(engine, messages, **kwargs):
+        calls.append((engine, candidate_of(messages)))
+        await asyncio.sleep(delay_of(messages))
+        return completion_for(messages)
+
+    def create(engine, messages, **kwargs):
+        calls.append((engine, candidate_of(messages)))
+        time.sleep(delay_of(messages))
+        return completion_for(messages)
+
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", acreate)
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    return calls
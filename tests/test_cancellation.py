@@ -0,0 +1,168 @@
+import asyncio
+import os
+import signal
+import threading
+import time
+
+from chexprompt.cancellation import RunControl
+from chexprompt.evaluator import UNFINISHED, ReportEvaluator
+from chexprompt.limiter import ThreadSafeRateLimiter
+from chexprompt.scheduler import EvaluationScheduler
+
+
+def test_time_budget_stops_run():
+    run_control = RunControl(time_budget=0.1)
+    run_control.start()
+
+    assert run_control.stopped.wait(timeout=2)
+    assert not run_control.forced.is_set()
+    run_control.close()
+
+
+def test_stop_calls_callbacks():
+    run_control = RunControl()
+    calls = []
+    run_control.add_callback(lambda: calls.append("first"))
+
+    run_control.stop(force=True)
+    run_control.add_callback(lambda: calls.append("late"))
+
+    assert run_control.stopped.is_set()
+    assert run_control.forced.is_set()
+    assert calls == ["first", "late"]
+
+
+def test_close_cancels_time_budget():
+    run_control = RunControl(time_budget=0.1)
+    run_control.start()
+    run_control.close()
+
+    time.sleep(0.2)
+
+    assert not run_control.stopped.is_set()
+
+
+def _statuses(results):
+    return [
+        UNFINISHED
+        if result.get("status") == UNFINISHED
+        else result["clinically_significant"]["false_positive_finding"]
+        for result in results
+    ]
+
+
+def test_time_budget_returns_partial_results(mock_openai):
+    evaluator = ReportEvaluator(
+        requests_per_minute=600, use_async=True, time_budget=0.3, grace_period=0
+    )
+
+    start = time.monotonic()
+    results = evaluator.evaluate(["reference"] * 4, ["1", "2", "3 5", "0 5"])
+
+    assert _statuses(results) == [1, 2, UNFINISHED, UNFINISHED]
+    assert time.monotonic() - start < 2
+
+
+def test_grace_period_lets_in_flight_requests_finish(mock_openai):
+    # Two requests are in flight when the budget runs out, the third one waits
+    # for the quota and is dropped.
+    evaluator = ReportEvaluator(
+        requests_per_minute=2, use_async=True, time_budget=0.2, grace_period=5
+    )
+
+    start = time.monotonic()
+    results = evaluator.evaluate(["reference"] * 3, ["1 0.5", "2 0.5", "3"])
+
+    assert _statuses(results) == [1, 2, UNFINISHED]
+    assert time.monotonic() - start < 2
+
+
+def test_forced_stop_of_threads_does_not_wait(mock_openai):
+    evaluator = ReportEvaluator(requests_per_minute=600, num_workers=2)
+    threading.Timer(0.2, evaluator.cancel, kwargs={"force": True}).start()
+
+    start = time.monotonic()
+    results = evaluator.evaluate(["reference"] * 2, ["1", "2 5"])
+
+    assert _statuses(results) == [1, UNFINISHED]
+    assert time.monotonic() - start < 2
+    # The abandoned request does not keep the interpreter from exiting.
+    assert all(
+        thread.daemon
+        for thread in threading.enumerate()
+        if thread is not threading.main_thread()
+    )
+
+
+def test_second_signal_interrupts_serial_request(mock_openai):
+    evaluator = ReportEvaluator(requests_per_minute=600, grace_period=10)
+    for delay in (0.1, 0.2):
+        threading.Timer(delay, os.kill, args=(os.getpid(), signal.SIGINT)).start()
+
+    start = time.monotonic()
+    results = evaluator.evaluate(["reference"] * 2, ["1 5", "2"])
+
+    assert _statuses(results) == [UNFINISHED, UNFINISHED]
+    assert time.monotonic() - start < 2
+    assert signal.getsignal(signal.SIGINT) is signal.default_int_handler
+
+
+def test_cancel_only_drops_own_waiting_requests(mock_openai):
+    # Both evaluators submit to the same job, served one request per 0.1 seconds.
+    scheduler = EvaluationScheduler(
+        limiter=ThreadSafeRateLimiter(1, time_period=0.1), show_progress=False
+    )
+    stopped = ReportEvaluator(grace_period=0)
+    running = ReportEvaluator()
+
+    async def evaluate_both():
+        async with scheduler:
+            asyncio.get_running_loop().call_later(0.15, stopped.cancel)
+            return await asyncio.gather(
+                stopped.evaluate_async(
+                    ["reference"] * 3, ["1", "1", "1"], scheduler, job_name="shared"
+                ),
+                running.evaluate_async(
+                    ["reference"] * 3, ["2", "2", "2"], scheduler, job_name="shared"
+                ),
+            )
+
+    stopped_results, running_results = asyncio.run(evaluate_both())
+
+    assert UNFINISHED in _statuses(stopped_results)
+    assert _statuses(running_results) == [2, 2, 2]
+
+
+def test_nested_run_stops_with_parent():
+    parent = RunControl(time_budget=10)
+    parent.start()
+    child = RunControl(time_budget=60, parent=parent)
+    child.start()
+
+    assert child.time_budget <= 10
+    parent.stop(force=True)
+
+    assert child.stopped.is_set()
+    assert child.forced.is_set()
+    child.close()
+    parent.close()
+
+
+def test_signal_only_interrupts_blocking_request():
+    evaluator = ReportEvaluator()
+    interruptible = threading.Event()
+
+    with evaluator._stop_on_signals(interruptible):
+        # Once the request loop is left, a second signal must not lose the results.
+        signal.raise_signal(signal.SIGINT)
+        signal.raise_signal(signal.SIGINT)
+
+        interruptible.set()
+        try:
+            signal.raise_signal(signal.SIGINT)
+        except KeyboardInterrupt:
+            interrupted = True
+        else:
+            interrupted = False
+
+    assert interrupted
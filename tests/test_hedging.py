@@ -0,0 +1,198 @@
+import asyncio
+
+import openai
+import pytest
+from conftest import completion_for
+
+from chexprompt.evaluator import ReportEvaluator
+from chexprompt.hedging import HedgeBudget, LatencyTracker
+from chexprompt.scheduler import EvaluationScheduler
+
+
+def test_latency_percentile():
+    tracker = LatencyTracker(window_size=100, min_samples=10)
+    for latency in range(1, 10):
+        tracker.add(float(latency))
+
+    assert tracker.percentile(0.9) is None
+
+    tracker.add(10.0)
+
+    assert tracker.percentile(0.9) == 9.0
+    assert tracker.percentile(0.5) == 5.0
+    assert tracker.percentile(0.99) == 10.0
+    with pytest.raises(ValueError):
+        tracker.percentile(1.0)
+
+
+def test_latency_window():
+    tracker = LatencyTracker(window_size=5, min_samples=1)
+    for latency in range(100):
+        tracker.add(float(latency))
+
+    assert len(tracker) == 5
+    assert tracker.percentile(0.2) == 95.0
+
+
+def test_hedge_budget():
+    budget = HedgeBudget(max_fraction=0.1)
+    for _ in range(9):
+        budget.record_request()
+
+    assert not budget.can_spend()
+
+    budget.record_request()
+
+    assert budget.can_spend()
+    budget.record_hedge()
+    assert not budget.can_spend()
+
+
+def test_censored_latencies_count_towards_the_tail():
+    tracker = LatencyTracker(window_size=100, min_samples=1)
+    for _ in range(5):
+        tracker.add(1.0)
+    for _ in range(5):
+        tracker.add(2.0, censored=True)
+
+    # Half of the requests were cancelled after 2 seconds, so the 90th
+    # percentile is at least 2 seconds, not 1 as the responses alone suggest.
+    assert tracker.percentile(0.5) == 1.0
+    assert tracker.percentile(0.9) == 2.0
+
+
+def test_hedge_budget_does_not_pile_up():
+    budget = HedgeBudget(max_fraction=0.5, burst=2)
+    for _ in range(100):
+        budget.record_request()
+
+    assert budget.tokens == 2
+    budget.record_hedge()
+    budget.record_hedge()
+    assert not budget.can_spend()
+
+
+@pytest.fixture
+def mock_engines(monkeypatch):
+    """Fakes an API whose response time and outcome depend on the engine.
+
+    Returns the dict of engine behaviours, as (seconds to respond, error or None),
+    and the list of (engine, outcome) events.
+    """
+    behaviours = {}
+    events = []
+
+    async def acreate(engine, messages, **kwargs):
+        delay, error = behaviours[engine]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            events.append((engine, "cancelled"))
+            raise
+        if error is not None:
+            events.append((engine, "failed"))
+            raise error
+        events.append((engine, "responded"))
+        return {"choices": [{"message": {"content": engine}}]}
+
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", acreate)
+    return behaviours, events
+
+
+def _hedging_evaluator(**kwargs):
+    evaluator = ReportEvaluator(
+        engine="primary",
+        hedge_engine="hedge",
+        hedge_percentile=0.5,
+        hedge_budget=1.0,
+        **kwargs,
+    )
+    for _ in range(evaluator.latency_tracker.min_samples):
+        evaluator.latency_tracker.add(0.05)
+    return evaluator
+
+
+async def _hedged_request(evaluator):
+    scheduler = EvaluationScheduler(show_progress=False)
+    prompt = [{"role": "user", "content": "prompt"}]
+    async with scheduler:
+        return await evaluator._hedged_openai_chat_completion_acreate(
+            prompt, scheduler
+        )
+
+
+def _content(response):
+    return response["choices"][0]["message"]["content"]
+
+
+def test_fast_primary_is_not_hedged(mock_engines):
+    behaviours, events = mock_engines
+    behaviours.update(primary=(0.0, None), hedge=(0.0, None))
+    evaluator = _hedging_evaluator()
+
+    response = asyncio.run(_hedged_request(evaluator))
+
+    assert _content(response) == "primary"
+    assert events == [("primary", "responded")]
+    assert evaluator.hedge_budget.hedges == 0
+
+
+def test_first_response_wins_and_loser_is_cancelled(mock_engines):
+    behaviours, events = mock_engines
+    behaviours.update(primary=(1.0, None), hedge=(0.05, None))
+    evaluator = _hedging_evaluator()
+    n_latencies = len(evaluator.latency_tracker)
+
+    response = asyncio.run(_hedged_request(evaluator))
+
+    assert _content(response) == "hedge"
+    assert events == [("hedge", "responded"), ("primary", "cancelled")]
+    assert evaluator.hedge_budget.hedge_wins == 1
+    # The winner is recorded, and so is the loser as a lower bound.
+    assert len(evaluator.latency_tracker) == n_latencies + 2
+
+
+def test_deadline_raises_timeout(mock_engines):
+    behaviours, events = mock_engines
+    behaviours.update(primary=(1.0, None), hedge=(1.0, None))
+    evaluator = _hedging_evaluator(request_timeout=0.2)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(_hedged_request(evaluator))
+
+    assert sorted(events) == [("hedge", "cancelled"), ("primary", "cancelled")]
+
+
+def test_failed_primary_falls_back_to_hedge(mock_engines):
+    behaviours, events = mock_engines
+    error = openai.error.APIError("Server error")
+    behaviours.update(primary=(0.1, error), hedge=(0.2, None))
+    evaluator = _hedging_evaluator()
+
+    response = asyncio.run(_hedged_request(evaluator))
+
+    assert _content(response) == "hedge"
+    assert events == [("primary", "failed"), ("hedge", "responded")]
+
+
+def test_invalid_hedge_percentile():
+    with pytest.raises(ValueError):
+        ReportEvaluator(hedge_percentile=95)
+
+
+def test_serial_deadline_is_retried(monkeypatch):
+    calls = []
+
+    def create(engine, messages, request_timeout=None, **kwargs):
+        calls.append(request_timeout)
+        if len(calls) == 1:
+            raise openai.error.Timeout("Request timed out")
+        return completion_for(messages)
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    evaluator = ReportEvaluator(request_timeout=5)
+
+    results = evaluator.evaluate("reference", "1")
+
+    assert calls == [5, 5]
+    assert results[0]["clinically_significant"]["false_positive_finding"] == 1
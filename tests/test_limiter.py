@@ -0,0 +1,26 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from chexprompt.limiter import ThreadSafeRateLimiter
+
+
+def test_burst_up_to_max_rate():
+    limiter = ThreadSafeRateLimiter(5, time_period=60)
+
+    for _ in range(5):
+        assert limiter.has_capacity()
+        limiter.acquire()
+
+    assert not limiter.has_capacity()
+
+
+def test_blocks_when_rate_exceeded():
+    limiter = ThreadSafeRateLimiter(10, time_period=1)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: limiter.acquire(), range(15)))
+    elapsed = time.monotonic() - start
+
+    # 10 requests fit in the burst, the other 5 drip out at 10 per second.
+    assert 0.4 <= elapsed < 1.5
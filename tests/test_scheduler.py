@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+from chexprompt.limiter import ThreadSafeRateLimiter
+from chexprompt.scheduler import EvaluationScheduler
+
+
+async def _run_jobs(scheduler, jobs):
+    order = []
+
+    async def request(job_name, index, size):
+        async with scheduler.slot(job_name, size=size):
+            order.append((job_name, index))
+            await asyncio.sleep(0)
+
+    tasks = [
+        request(job_name, index, size)
+        for job_name, sizes in jobs.items()
+        for index, size in enumerate(sizes)
+    ]
+    async with scheduler:
+        await asyncio.gather(*tasks)
+
+    return order
+
+
+def test_weighted_fair_sharing():
+    scheduler = EvaluationScheduler(
+        requests_per_minute=6000, max_concurrency=1, show_progress=False
+    )
+    scheduler.add_job("a", weight=2.0)
+    scheduler.add_job("b", weight=1.0)
+
+    order = asyncio.run(_run_jobs(scheduler, {"a": [0] * 8, "b": [0] * 8}))
+
+    first_six = [job_name for job_name, _ in order[:6]]
+    assert first_six.count("a") == 4
+    assert first_six.count("b") == 2
+
+
+def test_priority_is_served_first():
+    scheduler = EvaluationScheduler(
+        requests_per_minute=6000, max_concurrency=1, show_progress=False
+    )
+    scheduler.add_job("low", priority=0)
+    scheduler.add_job("high", priority=1)
+
+    order = asyncio.run(_run_jobs(scheduler, {"low": [0] * 3, "high": [0] * 3}))
+
+    assert [job_name for job_name, _ in order[:3]] == ["high"] * 3
+
+
+def test_shortest_prompt_first():
+    scheduler = EvaluationScheduler(
+        requests_per_minute=6000,
+        max_concurrency=1,
+        shortest_prompt_first=True,
+        show_progress=False,
+    )
+
+    order = asyncio.run(_run_jobs(scheduler, {"a": [30, 10, 20]}))
+
+    assert order == [("a", 1), ("a", 2), ("a", 0)]
+
+
+def test_job_progress():
+    scheduler = EvaluationScheduler(requests_per_minute=6000, show_progress=False)
+
+    asyncio.run(_run_jobs(scheduler, {"a": [0] * 4}))
+
+    stats = scheduler.progress()["a"]
+    assert stats.submitted == 4
+    assert stats.completed == 4
+    assert stats.pending == 0
+
+
+def test_cancelled_request_does_not_waste_quota():
+    async def run():
+        # One request every 0.2 seconds, so the test does not wait for minutes.
+        scheduler = EvaluationScheduler(
+            show_progress=False, limiter=ThreadSafeRateLimiter(1, time_period=0.2)
+        )
+
+        async def request():
+            async with scheduler.slot("a"):
+                pass
+
+        async with scheduler:
+            await request()
+            cancelled = asyncio.create_task(request())
+            await asyncio.sleep(0.05)
+            cancelled.cancel()
+            await asyncio.sleep(0.25)
+
+            start = asyncio.get_running_loop().time()
+            await request()
+            return asyncio.get_running_loop().time() - start
+
+    assert asyncio.run(run()) < 0.1
+
+
+def test_quota_carries_over_between_event_loops():
+    scheduler = EvaluationScheduler(
+        show_progress=False, limiter=ThreadSafeRateLimiter(4, time_period=1)
+    )
+
+    async def run(n_requests):
+        async def request():
+            async with scheduler.slot("a"):
+                pass
+
+        await asyncio.gather(*[request() for _ in range(n_requests)])
+
+    start = time.monotonic()
+    asyncio.run(run(4))
+    asyncio.run(run(2))
+
+    # The burst of 4 is spent by the first loop, the second loop waits for 2 more.
+    assert time.monotonic() - start >= 0.4
@@ -0,0 +1,151 @@
+import math
+import time
+
+from chexprompt.evaluator import ReportEvaluator
+from chexprompt.limiter import ThreadSafeRateLimiter
+from chexprompt.sequential import RunningMean, SequentialEvaluator
+
+
+def test_running_mean():
+    stats = RunningMean()
+    for value in [1, 2, 3, 4]:
+        stats.add(value)
+
+    assert stats.n == 4
+    assert stats.mean == 2.5
+    assert abs(stats.variance - 5 / 3) < 1e-9
+
+
+def test_interval_is_not_certain_without_variation():
+    stats = RunningMean()
+    stats.add(0)
+    assert stats.confidence_interval(0.05) == (-math.inf, math.inf)
+
+    for _ in range(39):
+        stats.add(0)
+    low, high = stats.confidence_interval(0.05)
+
+    assert low < 0 < high
+
+
+def test_stops_early_on_significance(mock_openai):
+    n_reports = 1000
+    references = ["reference"] * n_reports
+    candidates = {
+        "good": [str(i % 2) for i in range(n_reports)],
+        "bad": [str(2 + i % 2) for i in range(n_reports)],
+    }
+    evaluator = ReportEvaluator(use_async=True, requests_per_minute=100000)
+    sequential = SequentialEvaluator(evaluator, batch_size=20, min_reports=40, seed=0)
+
+    results = sequential.compare(references, candidates)
+
+    assert results["stop_reason"] == "significance"
+    assert results["n_rated"] < n_reports
+    assert len(mock_openai) == 2 * results["n_rated"]
+    assert results["api_calls"] == len(mock_openai)
+    assert results["ratings_saved"] == 2 * (n_reports - results["n_rated"])
+    assert results["api_calls_saved"] == results["ratings_saved"]
+    assert results["differences"]["good - bad"]["significant"]
+    assert results["differences"]["good - bad"]["mean"] < 0
+
+
+def test_rates_all_reports_without_difference(mock_openai):
+    n_reports = 100
+    references = ["reference"] * n_reports
+    candidates = {
+        "a": [str(i % 2) for i in range(n_reports)],
+        "b": [str((i + 1) % 2) for i in range(n_reports)],
+    }
+    evaluator = ReportEvaluator(requests_per_minute=100000)
+    sequential = SequentialEvaluator(evaluator, batch_size=10, seed=0)
+
+    results = sequential.compare(references, candidates)
+
+    assert results["stop_reason"] == "exhausted"
+    assert results["n_rated"] == n_reports
+    assert results["ratings_saved"] == 0
+    assert results["api_calls_saved"] == 0
+
+
+def test_counts_retried_api_calls(mock_openai):
+    n_reports = 100
+    references = ["reference"] * n_reports
+    # Every fourth rating of "a" can't be parsed, and is retried once.
+    candidates = {
+        "a": ["invalid" if i % 4 == 0 else "0" for i in range(n_reports)],
+        "b": ["1"] * n_reports,
+    }
+    evaluator = ReportEvaluator(use_async=True, requests_per_minute=100000)
+    sequential = SequentialEvaluator(
+        evaluator, batch_size=20, min_reports=40, seed=0
+    )
+
+    results = sequential.compare(references, candidates)
+
+    assert results["stop_reason"] == "significance"
+    assert results["api_calls"] == len(mock_openai)
+    assert results["api_calls"] > 2 * results["n_rated"]
+    assert results["api_calls_saved"] > results["ratings_saved"]
+
+
+def test_no_precision_stop_on_samples_without_errors(mock_openai):
+    n_reports = 1000
+    references = ["reference"] * n_reports
+    candidates = {"a": ["0"] * n_reports, "b": ["0"] * n_reports}
+    evaluator = ReportEvaluator(requests_per_minute=100000)
+    sequential = SequentialEvaluator(
+        evaluator,
+        batch_size=20,
+        precision=0.05,
+        stop_on_significance=False,
+        min_reports=40,
+        seed=0,
+    )
+
+    results = sequential.compare(references, candidates)
+
+    low, high = results["differences"]["a - b"]["ci"]
+    assert results["stop_reason"] == "precision"
+    assert results["n_rated"] > 40
+    assert high - low > 0
+
+
+def test_shares_quota_across_batches(mock_openai):
+    n_reports = 40
+    references = ["reference"] * n_reports
+    candidates = {"a": ["0"] * n_reports, "b": ["1"] * n_reports}
+    evaluator = ReportEvaluator(use_async=True)
+    # A burst of 30 requests, then one more every 0.02 seconds.
+    evaluator.rate_limiter = ThreadSafeRateLimiter(30, time_period=0.6)
+    sequential = SequentialEvaluator(
+        evaluator, batch_size=10, stop_on_significance=False, seed=0
+    )
+
+    start = time.monotonic()
+    results = sequential.compare(references, candidates)
+
+    # 80 requests: 30 in the burst, the other 50 at 50 per second.
+    assert time.monotonic() - start >= 0.9
+    assert results["n_rated"] == n_reports
+    assert len(mock_openai) == 2 * n_reports
+
+
+def test_time_budget_covers_all_batches(mock_openai):
+    n_reports = 10
+    references = ["reference"] * n_reports
+    candidates = {"a": ["0 0.2"] * n_reports, "b": ["1 0.2"] * n_reports}
+    evaluator = ReportEvaluator(
+        use_async=True, requests_per_minute=100000, time_budget=0.3
+    )
+    # Five batches of 0.2 seconds each.
+    sequential = SequentialEvaluator(
+        evaluator, batch_size=2, stop_on_significance=False, seed=0
+    )
+
+    start = time.monotonic()
+    results = sequential.compare(references, candidates)
+
+    assert results["stop_reason"] == "cancelled"
+    assert results["n_rated"] < n_reports
+    assert time.monotonic() - start < 0.8
@@ -0,0 +1,36 @@
+import asyncio
+import logging
+import time
+
+from chexprompt.evaluator import ReportEvaluator
+
+
+def _significant_errors(results):
+    return [result["clinically_significant"]["false_positive_finding"] for result in results]
+
+
+def test_threaded_results_keep_input_order(mock_openai):
+    evaluator = ReportEvaluator(requests_per_minute=600, num_workers=4)
+    candidates = ["3 0.3", "2 0.2", "1 0.1", "0"]
+
+    start = time.monotonic()
+    results = evaluator.evaluate(["reference"] * 4, candidates)
+    elapsed = time.monotonic() - start
+
+    assert _significant_errors(results) == [3, 2, 1, 0]
+    assert sorted(candidate for _, candidate in mock_openai) == sorted(candidates)
+    # The requests ran concurrently, while the fastest finished first.
+    assert elapsed < 0.5
+
+
+def test_async_falls_back_to_threads_in_running_loop(mock_openai, caplog):
+    evaluator = ReportEvaluator(requests_per_minute=600, use_async=True)
+
+    async def evaluate_in_loop():
+        return evaluator.evaluate(["reference"] * 3, ["2", "0", "1"])
+
+    with caplog.at_level(logging.WARNING):
+        results = asyncio.run(evaluate_in_loop())
+
+    assert _significant_errors(results) == [2, 0, 1]
+    assert "evaluating in a thread pool instead" in caplog.text